@@ -1,3 +1,5 @@
+from typing import Optional
+
 from go_networks.generate_v2 import main as gen_networks
 
 import click
@@ -79,16 +81,25 @@ def test(
     help=f"Network set ID to add the new networks to. Default: {PROD_SET}",
     default=PROD_SET,
 )
+@click.option(
+    "--n-proc",
+    type=int,
+    default=None,
+    help="The number of processes to assemble the networks with. "
+    "Default: the number of CPUs.",
+)
 def run(
     regenerate_props: bool,
     style_network: str,
     network_set: str,
+    n_proc: Optional[int] = None,
 ):
     """Run the go network generation."""
     gen_networks(
         network_set=network_set,
         style_network=style_network,
         regenerate=regenerate_props,
+        n_proc=n_proc,
     )
 
 
@@ -21,6 +21,8 @@ from indra.ontology.bio import bio_ontology
 from indra.preassembler.custom_preassembly import agents_stmt_type_matches
 from indra_db.client.principal.curation import get_curations
 
+from go_networks.util import get_go_descendants
+
 logger = logging.getLogger('go_networks')
 logging.getLogger('indra.sources.indra_db_rest.util').setLevel(logging.WARNING)
 
@@ -37,8 +39,9 @@ STMTS_BY_HASH_CACHE = {}
 def make_genes_by_go_id(path):
     """Load the gene/GO annotations as a pandas data frame."""
     goa = pd.read_csv(path, sep='\t',
-                      skiprows=31, dtype=str,
+                      skiprows=31, dtype='category',
                       header=None,
+                      usecols=['DB_ID', 'Qualifier', 'GO_ID'],
                       names=['DB',
                              'DB_ID',
                              'DB_Symbol',
@@ -56,15 +59,23 @@ def make_genes_by_go_id(path):
                              'Assigned',
                              'Annotation_Extension',
                              'Gene_Product_Form_ID'])
-    # Filter out all "NOT" negative evidences
-    goa['Qualifier'].fillna('', inplace=True)
-    goa = goa[~goa['Qualifier'].str.startswith('NOT')]
-
-    genes_by_go_id = defaultdict(set)
-    for idx, (go_id, up_id) in enumerate(zip(goa.GO_ID, goa.DB_ID)):
+    # Filter out all "NOT" negative evidences, matching the qualifier
+    # categories once rather than every row
+    not_qualifiers = [q for q in goa['Qualifier'].cat.categories
+                      if q.startswith('NOT')]
+    goa = goa[~goa['Qualifier'].isin(not_qualifiers)]
+
+    # Look up the gene name only once for each UniProt ID
+    gene_by_up_id = {}
+    for up_id in goa.DB_ID.unique():
         gene_name = uniprot_client.get_gene_name(up_id)
         if gene_name:
-            genes_by_go_id[go_id].add(gene_name)
+            gene_by_up_id[up_id] = gene_name
+    goa = goa.assign(gene_name=goa.DB_ID.map(gene_by_up_id))
+    goa = goa[goa.gene_name.notna()]
+
+    genes_by_go = goa.groupby('GO_ID', observed=True)['gene_name'].agg(set)
+    genes_by_go_id = defaultdict(set, genes_by_go.to_dict())
     return genes_by_go_id
 
 
@@ -138,7 +149,7 @@ def expand_complex(stmt):
 def get_genes_for_go_id(go_id):
     """Return genes that are annotated with a given go ID."""
     gene_names = genes_by_go_id[go_id]
-    for child_go_id in networkx.ancestors(go_dag, go_id):
+    for child_go_id in go_descendants[go_id]:
         gene_names |= genes_by_go_id[child_go_id]
     gene_names = sorted(gene_names)
     return gene_names
@@ -247,6 +258,7 @@ if __name__ == '__main__':
     indra_df = load_indra_df(INDRA_SIF_PICKLE)
     hashes_by_gene_pair = get_hashes_by_gene_pair(indra_df)
     genes_by_go_id = make_genes_by_go_id(GO_ANNOTS_PATH)
+    go_descendants = get_go_descendants(go_dag)
     go_ids = get_go_ids()
 
     # Stage 1. Get all hashes for each GO ID
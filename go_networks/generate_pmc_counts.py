@@ -102,7 +102,8 @@ def main(text_refs_tsv, stmts_tsv, pmc_map_file, ignore_ungrounded=True,
     # mapping
     logger.info('Aggregating counts per PMC ID')
     pmc_counts = {}
-    for reading_id, count in tqdm(reading_counts.items(), total=len(reading_counts)):
+    for reading_id, count in tqdm(reading_counts.items(), total=len(reading_counts),
+                                  mininterval=2.0, miniters=1000):
         pmc_id = pmc_map.get(reading_id)
         if pmc_id is not None:
             try:
@@ -113,7 +114,8 @@ def main(text_refs_tsv, stmts_tsv, pmc_map_file, ignore_ungrounded=True,
     # Write to pmc_map_file
     logger.info('Writing pmc_map to %s' % pmc_map_file)
     with open(pmc_map_file, 'w') as fo:
-        for pmc_id, count in tqdm(pmc_counts.items(), total=len(pmc_counts)):
+        for pmc_id, count in tqdm(pmc_counts.items(), total=len(pmc_counts),
+                                  mininterval=2.0, miniters=1000):
             try:
                 fo.write(f'{pmc_id}\t{count}\n')
             except KeyError:
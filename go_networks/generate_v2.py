@@ -4,12 +4,15 @@ Generate GO Networks from a list of GO terms and the Sif dump.
 import logging
 import pickle
 from collections import defaultdict
+from contextlib import ExitStack
 from datetime import datetime
-from itertools import combinations
+from multiprocessing import cpu_count, get_context
 from textwrap import dedent
 from typing import Dict, Iterator, Optional, Set, Tuple, Union, List
 
 import ndex2.client
+import networkx as nx
+import numpy as np
 import pandas as pd
 import pystow
 from indra.ontology.bio import bio_ontology
@@ -20,9 +23,9 @@ from ndex2 import NiceCXNetwork, create_nice_cx_from_server
 from tqdm import tqdm
 
 from go_networks.util import (
-    DIRECTED_TYPES,
     get_ndex_web_client,
     get_networks_in_set,
+    set_directed,
     NDEX_ARGS,
 )
 from go_networks.network_assembly import GoNetworkAssembler, get_cx_layout
@@ -38,7 +41,9 @@ NameEntityMap = Dict[str, Tuple[str, str]]
 
 # Constants
 cache = pystow.module("go_networks")
-GO_MAPPINGS = cache.join(name="go_mappings.pkl")
+# Versioned so that mappings cached before child genes were propagated to their
+# parent terms are not reused
+GO_MAPPINGS = cache.join(name="go_mappings_v2.pkl")
 COGEX_SIF = cache.join(name="cogex_sif.pkl")
 PROPS_FILE = cache.join(name="props.pkl")
 GO_NETWORKS = cache.join(name="networks.pkl")
@@ -46,6 +51,12 @@ NCX_CACHE = cache.module("ncx_cache")
 DEFAULT_NDEX_SERVER = "http://ndexbio.org"
 TEST_GO_ID = None
 
+# Direction of a statement relative to its sorted gene pair, encoded as the
+# position of the direction in PropAgg
+FORWARD = 0
+REVERSE = 1
+UNDIRECTED = 2
+
 min_gene_count = 5
 max_gene_count = 200
 
@@ -155,7 +166,7 @@ def get_sif_from_cogex(limit: Optional[int] = None) -> pd.DataFrame:
     results = n4j_client.query_tx(query)
     res_tuples = []
     logger.info("Generating SIF from database results")
-    for r in tqdm(results):
+    for r in tqdm(results, mininterval=2.0, miniters=1000):
         gene1 = n4j_client.neo4j_to_node(r[0])
         gene2 = n4j_client.neo4j_to_node(r[1])
         res_tuples.append(
@@ -204,6 +215,32 @@ def get_sif_from_cogex(limit: Optional[int] = None) -> pd.DataFrame:
     return df
 
 
+def _set_categorical_dtypes(sif_df: pd.DataFrame) -> pd.DataFrame:
+    """Store the namespace, name and statement type columns as categoricals
+
+    The A and B columns of the namespaces and of the names share one sorted
+    set of categories, so they can be compared with each other directly and
+    the order of their codes follows the order of the values.
+
+    Parameters
+    ----------
+    sif_df :
+        The SIF dataframe
+
+    Returns
+    -------
+    :
+        The SIF dataframe with categorical columns
+    """
+    dtypes = {"stmt_type": "category"}
+    for col_a, col_b in [("agA_ns", "agB_ns"), ("agA_name", "agB_name")]:
+        values = pd.concat([sif_df[col_a].astype(object), sif_df[col_b].astype(object)])
+        dtypes[col_a] = dtypes[col_b] = pd.CategoricalDtype(
+            np.sort(values.dropna().unique())
+        )
+    return sif_df.astype(dtypes)
+
+
 def get_sif(regenerate: bool = False) -> pd.DataFrame:
     if not regenerate and COGEX_SIF.exists():
         logger.info("Loading SIF from cache")
@@ -213,7 +250,7 @@ def get_sif(regenerate: bool = False) -> pd.DataFrame:
 
     else:
         cogex_sif = get_sif_from_cogex()
-    return cogex_sif
+    return _set_categorical_dtypes(cogex_sif)
 
 
 def generate_props(
@@ -251,55 +288,53 @@ def generate_props(
         # Load SIF
         sif_df = get_sif(regenerate)
 
-        hashes_by_pair = defaultdict(set)
-        props_by_hash = {}
-
-        def get_direction(row, pair):
-            directed = row.stmt_type in DIRECTED_TYPES
-            direction = row.agA_name == pair[0]
-            if directed:
-                if direction:
-                    return "forward"
-                else:
-                    return "reverse"
-            else:
-                return "undirected"
-
-        # For each pair of genes, generate the properties
+        # Get the sorted gene pair and the direction of each statement
+        # relative to the pair in one vectorized pass over the SIF. The name
+        # columns share sorted categories, so the sorted pair can be taken
+        # directly from the category codes.
         logger.info("Generating properties by hash")
-        for _, row in tqdm(sif_df.iterrows(), total=sif_df.shape[0]):
-            pair = tuple(sorted([row.agA_name, row.agB_name]))
-            hashes_by_pair[pair].add(row.stmt_hash)
-            if row.stmt_hash not in props_by_hash:
-                props_by_hash[row.stmt_hash] = {
-                    "ev_count": row.evidence_count,
-                    "stmt_type": row.stmt_type,
-                    "direction": get_direction(row, pair),
-                }
-        hashes_by_pair = dict(hashes_by_pair)
-
-        def aggregate_props(props) -> PropAgg:
-            ev_forward = defaultdict(int)
-            ev_reverse = defaultdict(int)
-            ev_undirected = defaultdict(int)
-            for prop in props:
-                if prop["direction"] == "forward":
-                    ev_forward[prop["stmt_type"]] += prop["ev_count"]
-                elif prop["direction"] == "reverse":
-                    ev_reverse[prop["stmt_type"]] += prop["ev_count"]
-                else:
-                    ev_undirected[prop["stmt_type"]] += prop["ev_count"]
-            return dict(ev_forward), dict(ev_reverse), dict(ev_undirected)
+        a = sif_df.agA_name.cat.codes.to_numpy()
+        b = sif_df.agB_name.cat.codes.to_numpy()
+        lo = np.minimum(a, b)
+        name_dtype = sif_df.agA_name.dtype
+        sif_df = sif_df.assign(
+            lo=pd.Categorical.from_codes(lo, dtype=name_dtype),
+            hi=pd.Categorical.from_codes(np.maximum(a, b), dtype=name_dtype),
+        )
+        set_directed(sif_df)
+        sif_df["direction"] = np.where(
+            sif_df.directed.to_numpy(), np.where(a == lo, FORWARD, REVERSE), UNDIRECTED
+        ).astype(np.int8)
+
+        # Each statement takes the properties of its first row in the SIF and
+        # is counted once per pair it appears in
+        sif_df["direction"] = sif_df.groupby("stmt_hash")["direction"].transform(
+            "first"
+        )
+        sif_df = sif_df.drop_duplicates(["lo", "hi", "stmt_hash"])
 
-        props_by_pair = {}
+        # Sum the evidence counts by pair, direction and statement type
         logger.info("Aggregating properties by pair")
-        for pair, hashes in tqdm(hashes_by_pair.items()):
-            props_by_pair[pair] = aggregate_props([props_by_hash[h] for h in hashes])
+        ev_counts = sif_df.groupby(
+            ["lo", "hi", "direction", "stmt_type"], observed=True
+        )["evidence_count"].sum()
+
+        # Fill the nested dicts straight from the grouped series; tolist()
+        # converts all the counts to Python ints in one call
+        props_by_pair = {}
+        for (g1, g2, direction, stmt_type), ev_count in zip(
+            ev_counts.index, ev_counts.tolist()
+        ):
+            if (g1, g2) not in props_by_pair:
+                props_by_pair[(g1, g2)] = ({}, {}, {})
+            props_by_pair[(g1, g2)][direction][stmt_type] = ev_count
 
         # Write to file if provided
         with PROPS_FILE.open(mode="wb") as fo:
             logger.info(f"Saving property lookup to {PROPS_FILE}")
-            pickle.dump(obj=props_by_pair, file=fo)
+            pickle.dump(
+                obj=props_by_pair, file=fo, protocol=pickle.HIGHEST_PROTOCOL
+            )
 
     return props_by_pair
 
@@ -322,6 +357,89 @@ def go_term_gene_query() -> Iterator[Tuple[Node, Node]]:
     )
 
 
+def _get_go_graph() -> nx.DiGraph:
+    """Get the GO terms of the bio ontology as a graph of GO IDs
+
+    Edges point from child to parent term, following the same isa and partof
+    relations as ``bio_ontology.get_children``.
+    """
+    bio_ontology.initialize()
+    go_graph = nx.DiGraph()
+    for child, parent, data in bio_ontology.edges(data=True):
+        if data["type"] not in {"isa", "partof"}:
+            continue
+        child_ns, child_id = bio_ontology.get_ns_id(child)
+        parent_ns, parent_id = bio_ontology.get_ns_id(parent)
+        if child_ns == parent_ns == "GO":
+            go_graph.add_edge(child_id, parent_id)
+    return go_graph
+
+
+def _add_child_genes(go_graph: nx.DiGraph, genes_by_go: Go2Genes) -> Go2Genes:
+    """Add the genes of all descendant terms to each annotated GO term
+
+    The gene set of each term is held as a bitset over an index of all genes
+    so that adding the genes of a child term to its parent is a single
+    vectorized OR. Children come before their parents in topological order,
+    so the bitset of a term is complete by the time it is added to its
+    parents.
+
+    Parameters
+    ----------
+    go_graph :
+        The GO graph with edges pointing from child to parent term
+    genes_by_go :
+        A dict mapping GO IDs to the genes directly annotated with them
+
+    Returns
+    -------
+    :
+        A dict mapping each annotated GO ID to the genes of the term and
+        its descendants
+    """
+    go_order = list(nx.topological_sort(go_graph))
+
+    # Only terms that are annotated or have annotated descendants get a bitset
+    go_with_genes = set(genes_by_go)
+    for go_id in go_order:
+        if go_id in go_with_genes:
+            go_with_genes.update(go_graph.successors(go_id))
+    go_ix = {go_id: ix for ix, go_id in enumerate(go_with_genes)}
+
+    genes = sorted(set().union(*genes_by_go.values()))
+    gene_ix = {gene: ix for ix, gene in enumerate(genes)}
+    bitsets = np.zeros((len(go_ix), (len(genes) + 63) // 64), dtype="<u8")
+
+    # Set the bits of the directly annotated genes
+    rows = []
+    cols = []
+    for go_id, gene_set in genes_by_go.items():
+        rows.extend([go_ix[go_id]] * len(gene_set))
+        cols.extend(gene_ix[gene] for gene in gene_set)
+    rows = np.array(rows, dtype=np.intp)
+    cols = np.array(cols, dtype=np.intp)
+    np.bitwise_or.at(
+        bitsets,
+        (rows, cols >> 6),
+        np.left_shift(np.uint64(1), (cols & 63).astype(np.uint64)),
+    )
+
+    for go_id in go_order:
+        if go_id not in go_ix:
+            continue
+        child_bits = bitsets[go_ix[go_id]]
+        for go_parent in go_graph.successors(go_id):
+            bitsets[go_ix[go_parent]] |= child_bits
+
+    # Convert back to gene sets, only for the annotated terms
+    gene_arr = np.array(genes, dtype=object)
+    res = {}
+    for go_id in genes_by_go:
+        bits = np.unpackbits(bitsets[go_ix[go_id]].view(np.uint8), bitorder="little")
+        res[go_id] = set(gene_arr[np.flatnonzero(bits[: len(genes)])])
+    return res
+
+
 def genes_by_go_id(regenerate: bool = False) -> Dict[str, Set[str]]:
     """Map go ids to gene symbols
 
@@ -345,32 +463,64 @@ def genes_by_go_id(regenerate: bool = False) -> Dict[str, Set[str]]:
 
     # Set initial mapping
     genes_by_go = defaultdict(set)
-    for go_node, gene in tqdm(go_term_gene_query(), desc="Loading from database"):
+    for go_node, gene in tqdm(
+        go_term_gene_query(),
+        desc="Loading from database",
+        mininterval=2.0,
+        miniters=1000,
+    ):
         genes_by_go[go_node.db_id].add(gene.data["name"])
 
     # Load bio ontology
     logger.info("Adding genes of child terms to the parent terms")
-    bio_ontology.initialize()
+    go_graph = _get_go_graph()
 
     # For each term, add the genes associated with its children as well
-    for go_id in tqdm(set(genes_by_go.keys()), desc="Adding genes of child terms"):
-        for go_child in bio_ontology.get_children("GO", go_id):
-            genes_by_go[go_id] |= genes_by_go[go_child]
-
-    # Reset defaultdict to dict
-    genes_by_go = dict(genes_by_go)
+    genes_by_go = _add_child_genes(go_graph, genes_by_go)
 
     # Save to cache
     with GO_MAPPINGS.open(mode="wb") as fw:
         logger.info("Caching GO mappings")
-        pickle.dump(obj=genes_by_go, file=fw)
+        pickle.dump(obj=genes_by_go, file=fw, protocol=pickle.HIGHEST_PROTOCOL)
 
     return genes_by_go
 
 
+def _assemble_network(
+    task: Tuple[str, Set[str], PropDict]
+) -> Tuple[str, Dict[str, Union[NiceCXNetwork, float]]]:
+    """Assemble the network of a single GO term
+
+    Parameters
+    ----------
+    task :
+        A tuple of the GO ID, the genes of the GO term and the pair
+        properties of the gene pairs within it
+
+    Returns
+    -------
+    :
+        A tuple of the GO ID and a dict with the assembled network and its
+        maximum and minimum edge scores
+    """
+    go_id, gene_set, prop_dict = task
+    gna = GoNetworkAssembler(
+        identifier=go_id,
+        entity_list=list(gene_set),
+        pair_properties=prop_dict,
+    )
+    gna.assemble()
+    return go_id, {
+        "network": gna.network,
+        "max_score": max(gna.rel_scores),
+        "min_score": min(gna.rel_scores),
+    }
+
+
 def build_networks(
     go2genes_map: Go2Genes,
     pair_props: PropDict,
+    n_proc: Optional[int] = None,
 ) -> Dict[str, Dict[str, Union[NiceCXNetwork, float]]]:
     """Build networks per go-id associated genes
 
@@ -380,45 +530,66 @@ def build_networks(
         A dict mapping GO ID to a list of genes
     pair_props :
         Lookup for edges
+    n_proc :
+        The number of processes to assemble the networks with. Default: the
+        number of CPUs.
 
     Returns
     -------
     :
         Dict of assembled networks by go id
     """
-    networks = {}
     skipped = 0
-    # Only pass the relevant parts of the pair_props dict
-    for go_id, gene_set in tqdm(go2genes_map.items(), total=len(go2genes_map)):
-        if TEST_GO_ID and go_id != TEST_GO_ID:
-            continue
 
-        def _key(g1, g2):
-            return tuple(sorted([g1, g2]))
+    # Index the pairs by their first (lexicographically smaller) gene so that
+    # the pairs within a gene set can be looked up without probing every
+    # combination of genes
+    pairs_by_gene = defaultdict(list)
+    for (g1, g2), prop in pair_props.items():
+        pairs_by_gene[g1].append((g2, prop))
+
+    def _tasks() -> Iterator[Tuple[str, Set[str], PropDict]]:
+        # Only pass the relevant parts of the pair_props dict, one GO term at
+        # a time as the networks are assembled
+        nonlocal skipped
+        for go_id, gene_set in go2genes_map.items():
+            if TEST_GO_ID and go_id != TEST_GO_ID:
+                continue
 
-        # Get relevant pairs from pair_properties
-        prop_dict = {
-            _key(g1, g2): pair_props[_key(g1, g2)]
-            for g1, g2 in combinations(gene_set, 2)
-            if _key(g1, g2) in pair_props
-        }
+            # Get relevant pairs from pair_properties
+            prop_dict = {
+                (g1, g2): prop
+                for g1 in gene_set
+                for g2, prop in pairs_by_gene.get(g1, ())
+                if g2 in gene_set
+            }
+
+            if not prop_dict:
+                # logger.info(f"No statements for ID {go_id}")
+                skipped += 1
+                continue
 
-        if not prop_dict:
-            # logger.info(f"No statements for ID {go_id}")
-            skipped += 1
-            continue
+            yield go_id, gene_set, prop_dict
 
-        gna = GoNetworkAssembler(
-            identifier=go_id,
-            entity_list=list(gene_set),
-            pair_properties=prop_dict,
-        )
-        gna.assemble()
-        networks[go_id] = {
-            "network": gna.network,
-            "max_score": max(gna.rel_scores),
-            "min_score": min(gna.rel_scores),
-        }
+    # Load the ontology up front so that forked workers share it instead of
+    # each loading their own copy
+    bio_ontology.initialize()
+
+    # Don't start more processes than there are GO terms
+    n_proc = max(1, min(n_proc or cpu_count(), len(go2genes_map)))
+    logger.info(
+        f"Assembling networks for {len(go2genes_map)} GO terms using {n_proc} "
+        f"processes"
+    )
+    with ExitStack() as stack:
+        if n_proc > 1:
+            # Fork explicitly, the platform default may be spawn or forkserver
+            pool = stack.enter_context(get_context("fork").Pool(n_proc))
+            # imap keeps the networks in the same order as go2genes_map
+            results = pool.imap(_assemble_network, _tasks(), chunksize=16)
+        else:
+            results = map(_assemble_network, _tasks())
+        networks = dict(tqdm(results, desc="Assembling networks"))
 
     logger.info(f"Skipped {skipped} networks without statements")
     return networks
@@ -443,13 +614,14 @@ def filter_self_loops(df):
 def filter_go_ids(go2genes_map) -> Dict[str, Set[str]]:
     return {
         go_id: genes
-        for go_id, genes in tqdm(go2genes_map.items(), desc="Filtering GO IDs")
+        for go_id, genes in go2genes_map.items()
         if min_gene_count <= len(genes) <= max_gene_count
     }
 
 
 def generate(
     regenerate: bool = False,
+    n_proc: Optional[int] = None,
 ) -> Dict[str, Dict[str, Union[NiceCXNetwork, float]]]:
     """Generate new GO networks from INDRA statements
 
@@ -458,6 +630,9 @@ def generate(
     regenerate :
         If True, regenerate the props from scratch and overwrite the existing
         props file, if it exists.
+    n_proc :
+        The number of processes to assemble the networks with. Default: the
+        number of CPUs.
     """
     # Make genes by GO ID dict
     go2genes_map = genes_by_go_id(regenerate=regenerate)
@@ -469,7 +644,7 @@ def generate(
     sif_props = generate_props(regenerate=regenerate)
 
     # Iterate by GO ID and for each list of genes, build a network
-    return build_networks(go2genes_map, sif_props)
+    return build_networks(go2genes_map, sif_props, n_proc=n_proc)
 
 
 def download_ncx_from_uuids(ncx_uuids):
@@ -496,7 +671,7 @@ def get_ncx_cache_from_set(ncx_set_uuid: str, refresh=False):
         else:
             ncx = create_nice_cx_from_server(uuid=ncx_uuid, **NDEX_ARGS)
             with ncx_file.open("wb") as f:
-                pickle.dump(obj=ncx, file=f)
+                pickle.dump(obj=ncx, file=f, protocol=pickle.HIGHEST_PROTOCOL)
 
         # network_info = ndex_web_client.get_network_summary(ncx_uuid)
 
@@ -814,6 +989,7 @@ def main(
     regenerate: bool,
     test_go_term: Optional[str] = None,
     ndex_server_style: str = DEFAULT_NDEX_SERVER,
+    n_proc: Optional[int] = None,
 ):
     global TEST_GO_ID
     logger.info(f"Using network set id {network_set}")
@@ -824,13 +1000,13 @@ def main(
 
     logger.info(f"Using ndex server {ndex_server_style} for style")
 
-    networks = generate(regenerate=regenerate)
+    networks = generate(regenerate=regenerate, n_proc=n_proc)
 
     # Only cache the networks if we're not testing
     if not test_go_term:
         with GO_NETWORKS.open("wb") as f:
             logger.info(f"Writing networks to {GO_NETWORKS}")
-            pickle.dump(networks, f)
+            pickle.dump(networks, f, protocol=pickle.HIGHEST_PROTOCOL)
     else:
         logger.info("TEST: Not caching networks")
 
@@ -17,7 +17,6 @@ import pickle
 from typing import Tuple, Optional, List, Dict, Union
 from urllib.error import URLError
 
-import numpy as np
 import pandas as pd
 from ndex2 import create_nice_cx_from_server
 from ndex2.client import Ndex2
@@ -452,7 +451,7 @@ def merge_dfs(sif, cx, merge_how="outer") -> pd.DataFrame:
         sif.groupby(groupby_cols)
         .aggregate(
             {
-                "evidence_count": np.sum,
+                "evidence_count": "sum",
                 "stmt_hash": pd.Series.tolist,
                 "belief": pd.Series.tolist,
                 "source_counts": pd.Series.tolist,
@@ -500,12 +499,14 @@ def get_merged_df(
     sif_df = pd.read_pickle(sif_file)
 
     # Make a name to NS-ID mapping from the sif dump
-    sif_ns_id_map = {
-        n: (ns, _id)
-        for ns, _id, n in set(zip(sif_df.agA_ns, sif_df.agA_id, sif_df.agA_name)).union(
-            set(zip(sif_df.agB_ns, sif_df.agB_id, sif_df.agB_name))
-        )
-    }
+    entity_cols = ["ns", "id", "name"]
+    entities = pd.concat(
+        [
+            sif_df[["agA_ns", "agA_id", "agA_name"]].set_axis(entity_cols, axis=1),
+            sif_df[["agB_ns", "agB_id", "agB_name"]].set_axis(entity_cols, axis=1),
+        ]
+    ).drop_duplicates("name")
+    sif_ns_id_map = dict(zip(entities.name, zip(entities.ns, entities.id)))
 
     # Load the CX network
     logger.info(f"Loading the CX network from {ncipid_file}")
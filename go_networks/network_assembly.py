@@ -114,7 +114,8 @@ def _move_nodes_apart(
 
     # First calculate the euclidian distance between all nodes
     node_pairs = [
-        sorted(c, key=lambda x: x[0]) for c in combinations(pos.keys(), 2)
+        (n1, n2) if n1[0] <= n2[0] else (n2, n1)
+        for n1, n2 in combinations(pos.keys(), 2)
     ]
     distances = {(n1, n2): dist(pos[n1], pos[n2]) for n1, n2 in node_pairs}
 
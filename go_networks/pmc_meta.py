@@ -37,10 +37,11 @@ For what I have done in the past, I have just taken the first entries
 """
 import csv
 import argparse
-import codecs
 import logging
+from itertools import islice
+from multiprocessing import Pool, cpu_count
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 from lxml import etree
 from tqdm import tqdm
@@ -53,6 +54,14 @@ from indra.literature.pmc_client import _remove_elements_by_tag, \
 
 logger = logging.getLogger(__name__)
 
+# Parser and XPath queries shared by all calls to extract_info_from_pmc_xml
+PMC_XML_PARSER = etree.XMLParser(huge_tree=True, recover=True)
+XP_CORR_AUTHOR = etree.XPath(".//contrib[@contrib-type='author' and @corresp='yes']")
+XP_EMAIL = etree.XPath(".//email")
+XP_JOURNAL_TITLE = etree.XPath(".//journal-title")
+XP_PUB_YEAR = etree.XPath(".//pub-date/year")
+XP_ARTICLE_TITLE = etree.XPath("./article-meta/title-group/article-title")
+
 
 def buf_count_newlines_gen(fname: str) -> int:
     # Source https://stackoverflow.com/a/68385697/10478812
@@ -187,12 +196,10 @@ def hex_bin_to_str(raw_hex_bin: str) -> str:
     str
         String
     """
-    decode_hex = codecs.getdecoder("hex_codec")
     # It's a plain text string containing hex-encoded bytes, so it's first
     # two characters are escaping the hex-encoding: '\\x1f8b0808......'
     start_ix = 2 if raw_hex_bin.startswith("\\") else 0
-    hex_str = decode_hex(raw_hex_bin[start_ix:])[0]
-    return decompress(hex_str).decode()
+    return decompress(bytes.fromhex(raw_hex_bin[start_ix:])).decode()
 
 
 def extract_info_from_pmc_xml(xml_str: str) -> dict:
@@ -214,21 +221,22 @@ def extract_info_from_pmc_xml(xml_str: str) -> dict:
     -------
     :
     """
-    tree = etree.fromstring(xml_str.encode('utf-8'))
-    corr_author_query = ".//contrib[@contrib-type='author' and @corresp='yes']"
+    tree = etree.fromstring(xml_str.encode('utf-8'), parser=PMC_XML_PARSER)
+    if tree is None:
+        raise ValueError("Could not recover any XML from the input")
 
-    def _get_email(root):
+    def _get_email(root, corr_author):
         # Get the email of the corresponding author or any email if the
         # corresponding author doesn't have an email
-        corr_author = root.xpath(corr_author_query)
-        if corr_author and corr_author[0].xpath(".//email"):
-            return corr_author[0].xpath(".//email")[0].text
+        corr_emails = XP_EMAIL(corr_author[0]) if corr_author else []
+        if corr_emails:
+            return corr_emails[0].text
         else:
-            any_email = root.xpath(".//email")
+            any_email = XP_EMAIL(root)
             return (any_email[0].text or None) if any_email else None
 
     def _get_pub_year(root):
-        pub_years = [y.text for y in root.xpath(".//pub-date/year")]
+        pub_years = [y.text for y in XP_PUB_YEAR(root)]
         if pub_years:
             # Get earliest publication year
             return min(pub_years)
@@ -252,23 +260,19 @@ def extract_info_from_pmc_xml(xml_str: str) -> dict:
         # First process front element. Titles alt-titles and abstracts
         # are pulled from here.
         front_elements = _select_from_top_level(root, 'front')
-        title_xpath = './article-meta/title-group/article-title'
         for front_element in front_elements:
-            for element in front_element.xpath(title_xpath):
+            for element in XP_ARTICLE_TITLE(front_element):
                 return ' '.join(element.itertext())
 
     # Corresponding author
-    corr_auth = tree.xpath(corr_author_query)
+    corr_auth = XP_CORR_AUTHOR(tree)
 
     # Get email
-    email = _get_email(tree)
+    email = _get_email(tree, corr_auth)
 
     # Journal name
-    journal = (
-        (tree.xpath(".//journal-title")[0].text or None)
-        if tree.xpath(".//journal-title")
-        else None
-    )
+    journal_titles = XP_JOURNAL_TITLE(tree)
+    journal = (journal_titles[0].text or None) if journal_titles else None
 
     # Article title
     try:
@@ -328,12 +332,29 @@ def _read_trid_xml_csv(path: str) -> dict:
     return trid_xml_map
 
 
+def _process_row(row: Tuple[Optional[str], str, int, Optional[str]]) -> \
+        Tuple[Optional[str], str, int, Optional[dict]]:
+    # Convert hex-encoded raw string to string and extract metadata from PMC
+    # XML. This runs in a worker process, so failures are passed back as None
+    pmc, trid, count, raw_xml = row
+    if raw_xml is None:
+        # Row that is skipped without parsing
+        return pmc, trid, count, None
+    try:
+        xml_info = extract_info_from_pmc_xml(hex_bin_to_str(raw_xml))
+    except ValueError:
+        xml_info = None
+    return pmc, trid, count, xml_info
+
+
 def main(
         pmc_reading_id_path: str,
         reading_xml_path: str,
         pmc_count_path: str,
         out_path: str,
         xml_lines: Optional[int] = None,
+        n_proc: Optional[int] = None,
+        batch_size: int = 10000,
 ):
     # Get the PMC count
     # Note: This file is generated by the `generate_pmc_count.py` script
@@ -372,62 +393,78 @@ def main(
     if xml_lines is None:
         xml_lines = buf_count_newlines_gen(reading_xml_path)
 
-    logger.info(f"Processing {xml_lines} lines from XML {reading_xml_path}.")
-    t = tqdm(total=xml_lines)
-    with open(reading_xml_path, "r") as fi, \
-            open(out_path, "w", newline='') as fo, \
-            open('failed_xml.csv', 'w') as f_failed:
-        # Get csv writer
-        writer = csv.writer(fo, delimiter="\t")
+    logger.info(f"Processing {xml_lines} lines from XML {reading_xml_path} "
+                f"using {n_proc or cpu_count()} processes.")
+    t = tqdm(total=xml_lines, mininterval=2.0, miniters=1000)
 
-        # Add header to output file
-        writer.writerow(["pmc_id", "journal", "article_title", "email",
-                         "corresponding_author", "year", "evidence_count"])
+    def _rows(fi):
+        # Yield every row in file order. Rows without a PMC ID mapping or
+        # with an already processed PMC ID are passed on without their XML
+        # so that they are not parsed, but still counted in order below.
         line = fi.readline()
         # Check if the first line is the header
         if line.startswith(("text_ref_id\t", "trid\t")):
             line = fi.readline()
 
-        read_lines = 1
         while line:
             # Update progress bar
             t.update()
 
             # Get content
             trid, raw_xml = line.strip().split(",")
+            line = fi.readline()
 
-            # Get PMC ID
+            # Get PMC ID and evidence count
             pmc = trid_pmc_map.get(trid)
+            count = pmc_counts.get(pmc, 0)
+            if pmc is None or pmc in processed_ids:
+                raw_xml = None
+
+            yield pmc, trid, count, raw_xml
+
+    def _results(rows):
+        # Decompress and parse the XML in batches so that only a bounded
+        # number of rows is held in memory at a time. imap returns the
+        # results in file order.
+        batch = list(islice(rows, batch_size))
+        while batch:
+            yield from pool.imap(_process_row, batch, chunksize=64)
+            batch = list(islice(rows, batch_size))
 
+    with open(reading_xml_path, "r") as fi, \
+            open(out_path, "w", newline='') as fo, \
+            open('failed_xml.csv', 'w') as f_failed, \
+            Pool(n_proc) as pool:
+        # Get csv writer
+        writer = csv.writer(fo, delimiter="\t")
+
+        # Add header to output file
+        writer.writerow(["pmc_id", "journal", "article_title", "email",
+                         "corresponding_author", "year", "evidence_count"])
+
+        # A PMC ID is only marked as processed once a copy of it has been
+        # parsed and written, so later copies of a PMC ID that failed to
+        # parse are still tried
+        read_lines = 1
+        for pmc, trid, count, xml_info in _results(_rows(fi)):
             # Skip if no PMC ID
             if pmc is None:
                 missing_pmc_mapping += 1
-                line = fi.readline()
                 continue
 
             # Skip if already processed
             elif pmc in processed_ids:
                 duplicate_pmc_mapping += 1
-                line = fi.readline()
                 continue
 
-            # Get the evidence count
-            count = pmc_counts.get(pmc, 0)
-
             # Count the no counts, but don't skip
             if not count:
                 missing_counts += 1
 
-            try:
-                # Convert hex-encoded raw string to string and extract metadata
-                # from PMC XML
-                xml_str = hex_bin_to_str(raw_xml)
-                xml_info = extract_info_from_pmc_xml(xml_str)
-            except ValueError:
+            if xml_info is None:
                 logger.warning(
                     f"Failed to parse XML for PMC {pmc}; TRID {trid}")
                 f_failed.write(f"{pmc},{trid}\n")
-                line = fi.readline()
                 continue
 
             # Write to the output file:
@@ -447,14 +484,11 @@ def main(
                 xml_info["year"],
                 count
             ])
-
             processed_ids.add(pmc)
 
             if read_lines > xml_lines:
                 logger.info(f"Read {read_lines} lines")
                 break
-
-            line = fi.readline()
             read_lines += 1
 
     t.close()
@@ -488,6 +522,11 @@ if __name__ == "__main__":
         help="Number of lines to read from the XML file. If "
              "not specified, all lines will be read.",
     )
+    parser.add_argument(
+        "--n_proc", type=int,
+        help="Number of processes to parse the XML with. If not specified, "
+             "the number of CPUs is used.",
+    )
     args = parser.parse_args()
 
     assert args.pmc_reading_id_path.endswith(
@@ -506,4 +545,5 @@ if __name__ == "__main__":
         args.pmc_count_path,
         args.out_path,
         args.xml_lines,
+        args.n_proc,
     )
@@ -1,3 +1,11 @@
+import networkx as nx
+
+from go_networks import generate_v2
+from go_networks.generate_v2 import (
+    _add_child_genes,
+    _get_go_graph,
+    _set_categorical_dtypes,
+)
 from go_networks.tests import _gen_df
 from go_networks.util import DIRECTED_TYPES, UNDIRECTED_TYPES, set_directed
 
@@ -11,3 +19,73 @@ def test_set_directed():
     assert sif.directed.sum() == directed_count
     assert (sif.directed == False).sum() == undirected_count
     assert sif.directed.isna().sum() == 0
+
+
+def test_set_categorical_dtypes():
+    sif = _gen_df()
+    cat_sif = _set_categorical_dtypes(sif)
+
+    assert cat_sif.stmt_type.dtype == "category"
+    for col_a, col_b in [("agA_ns", "agB_ns"), ("agA_name", "agB_name")]:
+        a = cat_sif[col_a]
+        b = cat_sif[col_b]
+        assert a.dtype == b.dtype
+        assert a.cat.categories.equals(b.cat.categories)
+        assert a.cat.categories.is_monotonic_increasing
+
+        # Comparing the codes is the same as comparing the names
+        a_codes = a.cat.codes.to_numpy()
+        b_codes = b.cat.codes.to_numpy()
+        assert ((a_codes < b_codes) == (sif[col_a] < sif[col_b])).all()
+        assert ((a_codes == b_codes) == (sif[col_a] == sif[col_b])).all()
+        assert (a.astype(str) == sif[col_a]).all()
+
+
+class _FakeOntology(nx.DiGraph):
+    def initialize(self):
+        pass
+
+    @staticmethod
+    def get_ns_id(node):
+        return tuple(node.split(":", 1))
+
+
+def test_child_genes_added_to_parents(monkeypatch):
+    ontology = _FakeOntology()
+    ontology.add_edge("GO:GO:3", "GO:GO:2", type="isa")
+    ontology.add_edge("GO:GO:2", "GO:GO:1", type="partof")
+    ontology.add_edge("GO:GO:4", "GO:GO:1", type="xref")
+    ontology.add_edge("HGNC:1", "GO:GO:1", type="isa")
+    monkeypatch.setattr(generate_v2, "bio_ontology", ontology)
+
+    go_graph = _get_go_graph()
+    assert set(go_graph.edges) == {("GO:3", "GO:2"), ("GO:2", "GO:1")}
+
+    genes_by_go = {"GO:1": {"A"}, "GO:2": {"B"}, "GO:3": {"C"}, "GO:4": {"D"}}
+    genes = _add_child_genes(go_graph, genes_by_go)
+    assert genes == {
+        "GO:1": {"A", "B", "C"},
+        "GO:2": {"B", "C"},
+        "GO:3": {"C"},
+        "GO:4": {"D"},
+    }
+
+
+def test_add_child_genes():
+    # GO:2 has no genes of its own but links GO:3 to GO:1, GO:5 is not in the
+    # graph and the 70 genes span two words of the bitsets
+    go_graph = nx.DiGraph([("GO:3", "GO:2"), ("GO:2", "GO:1"), ("GO:4", "GO:1")])
+    genes = [f"G{i:02d}" for i in range(70)]
+    genes_by_go = {
+        "GO:1": {genes[0]},
+        "GO:3": set(genes[60:70]),
+        "GO:4": set(genes[1:5]),
+        "GO:5": {genes[69], genes[5]},
+    }
+    child_genes = _add_child_genes(go_graph, genes_by_go)
+
+    assert set(child_genes) == set(genes_by_go)
+    assert child_genes["GO:1"] == {genes[0]} | set(genes[1:5]) | set(genes[60:70])
+    assert child_genes["GO:3"] == set(genes[60:70])
+    assert child_genes["GO:4"] == set(genes[1:5])
+    assert child_genes["GO:5"] == {genes[69], genes[5]}
@@ -0,0 +1,82 @@
+import csv
+from gzip import compress
+
+from go_networks.pmc_meta import _process_row, main
+
+
+def _hex_xml(journal: str, year: int) -> str:
+    xml = (
+        f"<article><front><journal-meta><journal-title>{journal}"
+        f"</journal-title></journal-meta><article-meta><pub-date><year>{year}"
+        f"</year></pub-date></article-meta></front></article>"
+    )
+    return "\\x" + compress(xml.encode()).hex()
+
+
+def test_process_row():
+    pmc, trid, count, xml_info = _process_row(
+        ("PMC1", "1", 3, _hex_xml("Journal A", 2001))
+    )
+    assert (pmc, trid, count) == ("PMC1", "1", 3)
+    assert xml_info["journal"] == "Journal A"
+    assert xml_info["year"] == "2001"
+    assert xml_info["corresponding_author"] is False
+
+    # Rows that aren't valid hex fail to parse, rows without XML are skipped
+    assert _process_row(("PMC1", "1", 3, "not hex"))[3] is None
+    assert _process_row(("PMC1", "1", 3, None))[3] is None
+
+
+def _run_main(tmp_path, xml_lines=None):
+    rows = [
+        ("1", "not hex"),  # PMC1 fails to parse
+        ("2", _hex_xml("Journal B", 2002)),  # PMC1, used instead of trid 1
+        ("3", _hex_xml("Journal C", 2003)),  # PMC1, duplicate
+        ("4", _hex_xml("Journal D", 2004)),  # No PMC ID
+        ("5", _hex_xml("Journal E", 2005)),  # PMC2, no evidence count
+        ("6", _hex_xml("Journal F", 2006)),  # PMC3
+        ("7", "not hex"),  # PMC3, duplicate
+    ]
+    trid_pmc = {"1": "PMC1", "2": "PMC1", "3": "PMC1", "5": "PMC2", "6": "PMC3",
+                "7": "PMC3"}
+    (tmp_path / "xml.csv").write_text(
+        "trid\txml\n" + "".join(f"{trid},{xml}\n" for trid, xml in rows)
+    )
+    (tmp_path / "trid_pmc.csv").write_text(
+        "trid,pmcid\n" + "".join(f"{t},{p}\n" for t, p in trid_pmc.items())
+    )
+    (tmp_path / "counts.tsv").write_text("pmcid\tcount\nPMC1\t4\nPMC3\t6\n")
+
+    main(
+        pmc_reading_id_path=str(tmp_path / "trid_pmc.csv"),
+        reading_xml_path=str(tmp_path / "xml.csv"),
+        pmc_count_path=str(tmp_path / "counts.tsv"),
+        out_path=str(tmp_path / "out.tsv"),
+        xml_lines=xml_lines,
+        n_proc=2,
+        batch_size=2,
+    )
+    with open(tmp_path / "out.tsv") as f:
+        out = [(r["pmc_id"], r["journal"], r["year"], r["evidence_count"])
+               for r in csv.DictReader(f, delimiter="\t")]
+    failed = (tmp_path / "failed_xml.csv").read_text().splitlines()
+    return out, failed
+
+
+def test_main(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    out, failed = _run_main(tmp_path)
+    assert out == [
+        ("PMC1", "Journal B", "2002", "4"),
+        ("PMC2", "Journal E", "2005", "0"),
+        ("PMC3", "Journal F", "2006", "6"),
+    ]
+    assert failed == ["PMC1,1"]
+
+
+def test_main_xml_lines(tmp_path, monkeypatch):
+    # The line limit counts written rows only
+    monkeypatch.chdir(tmp_path)
+    out, failed = _run_main(tmp_path, xml_lines=1)
+    assert [row[0] for row in out] == ["PMC1", "PMC2"]
+    assert failed == ["PMC1,1"]
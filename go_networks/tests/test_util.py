@@ -0,0 +1,27 @@
+import networkx
+
+from go_networks.util import get_go_descendants
+
+
+def test_get_go_descendants():
+    # Edges point from child to parent, GO:3 and GO:4 are on a cycle and
+    # GO:6 is disconnected from the rest
+    dag = networkx.MultiDiGraph()
+    dag.add_edges_from(
+        [
+            ("GO:2", "GO:1"),
+            ("GO:3", "GO:2"),
+            ("GO:4", "GO:3"),
+            ("GO:3", "GO:4"),
+            ("GO:5", "GO:4"),
+            ("GO:5", "GO:1"),
+        ]
+    )
+    dag.add_node("GO:6")
+
+    descendants = get_go_descendants(dag)
+    assert set(descendants) == set(dag.nodes)
+    for go_id in dag.nodes:
+        assert descendants[go_id] == networkx.ancestors(dag, go_id)
+    assert descendants["GO:3"] == {"GO:4", "GO:5"}
+    assert descendants["GO:6"] == set()
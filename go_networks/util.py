@@ -1,7 +1,9 @@
 import logging
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set
 
+import networkx as nx
+import pandas as pd
 from ndex2 import Ndex2
 
 from indra.databases import ndex_client
@@ -11,6 +13,8 @@ __all__ = [
     "stmts_by_directedness",
     "DIRECTED_TYPES",
     "UNDIRECTED_TYPES",
+    "set_directed",
+    "get_go_descendants",
     "NDEX_ARGS",
     "get_ndex_web_client",
     "get_networks_in_set",
@@ -57,8 +61,59 @@ def stmts_by_directedness(directed: bool) -> List[str]:
 
 
 # statement types by directedness
-DIRECTED_TYPES = stmts_by_directedness(True)
-UNDIRECTED_TYPES = stmts_by_directedness(False)
+DIRECTED_TYPES = frozenset(stmts_by_directedness(True))
+UNDIRECTED_TYPES = frozenset(stmts_by_directedness(False))
+
+
+def set_directed(sif_df: pd.DataFrame):
+    """Add a boolean column 'directed' to a SIF dataframe, in place
+
+    Parameters
+    ----------
+    sif_df :
+        A SIF dataframe with a 'stmt_type' column
+    """
+    sif_df["directed"] = sif_df.stmt_type.isin(DIRECTED_TYPES)
+
+
+def get_go_descendants(dag: nx.DiGraph) -> Dict[str, Set[str]]:
+    """Return the descendant GO IDs of each GO ID in the GO DAG
+
+    Edges in the GO DAG point from child to parent, so these are the nodes
+    that networkx.ancestors returns for each GO ID. The table is built in
+    one sweep over the condensation of the graph, which also handles cycles
+    through non-is_a relations.
+
+    Parameters
+    ----------
+    dag :
+        The GO DAG with edges pointing from child to parent term
+
+    Returns
+    -------
+    :
+        A dict mapping each GO ID to the set of its descendant GO IDs
+    """
+    cond = nx.condensation(dag)
+    descendants_by_comp = {}
+    # Child components come before their parents in topological order
+    for comp in nx.topological_sort(cond):
+        descendants = set()
+        for child_comp in cond.predecessors(comp):
+            descendants |= cond.nodes[child_comp]["members"]
+            descendants |= descendants_by_comp[child_comp]
+        descendants_by_comp[comp] = descendants
+
+    descendants_by_go_id = {}
+    for comp, descendants in descendants_by_comp.items():
+        members = cond.nodes[comp]["members"]
+        for go_id in members:
+            if len(members) > 1:
+                # Terms on a cycle are descendants of each other
+                descendants_by_go_id[go_id] = descendants | (members - {go_id})
+            else:
+                descendants_by_go_id[go_id] = descendants
+    return descendants_by_go_id
 
 
 NDEX_BASE_URL = "http://public.ndexbio.org"